@@ -25,12 +25,83 @@ Usage:
 """
 
 # src/agent.py
+import asyncio
+import copy
 import json
-import re
+import sys
+import time
+from collections import deque
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 import openai
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
+from config import Config
+from utils import ActionParser, LLMCache
+
+# the agent uses the same compiled action pattern as the parser in utils so a response is scanned only once
+_PARSE_RE = ActionParser.ACTION_RE
+
+
+# this is used while streaming to stop reading once the response holds a complete action
+def _contains_action(text: str) -> bool:
+    return _PARSE_RE.search(text) is not None
+
+# the instructions are the static prefix of every request, providers can cache an identical prefix across calls
+_SYSTEM_PROMPT = """You are an agent operating an Android phone. Given a goal and the current observation, choose the next best action to achieve the goal. Respond in the format:
+CLICK("element_name") or SCROLL("direction") or TYPE("text")"""
+
+# the few-shot examples never change so they are built once here instead of on every call
+_FEW_SHOT_EXAMPLES = """Examples:
+Goal: Open calculator app
+Observation: App: Home, UI Elements: ["Calculator", "Settings", "Chrome"]
+Action: CLICK("Calculator")
+
+Goal: Uninstall app
+Observation: App: Settings, UI Elements: ["Apps", "Display", "Sound"]
+Action: CLICK("Apps")
+
+Goal: Send message "Hello"
+Observation: App: Messages, UI Elements: ["Compose", "Search", "Settings"]
+Action: CLICK("Compose")
+"""
+
+# the self-reflection checklist is also static and follows the instructions in the system prompt
+_REFLECTION_SUFFIX = """
+Before choosing an action, consider:
+1. What is the current state of the app?
+2. What UI elements are available?
+3. Which action will move me closer to the goal?
+4. Are there any intermediate steps needed?
+
+Reasoning: [Explain your thought process]
+Action: [Your chosen action]
+"""
+
+# the system prompt of each template is put together once
+_FEW_SHOT_SYSTEM = _SYSTEM_PROMPT + "\n\n" + _FEW_SHOT_EXAMPLES
+_SELF_REFLECTION_SYSTEM = _SYSTEM_PROMPT + "\n" + _REFLECTION_SUFFIX
+
+# only the first UI elements are put into the prompt since the prompt length drives the latency and cost
+MAX_UI_ELEMENTS = 20
+
+
+# the agent often stays on the same screen for several steps, so the formatted observation is cached
+@lru_cache(maxsize=256)
+def _observation_prompt_cached(goal: str, app_name: str, ui_elements: Tuple) -> str:
+    return f"""Goal: {goal}
+Observation:
+- App: {app_name}
+- UI Elements: {json.dumps(ui_elements, separators=(',', ':'), ensure_ascii=False)}"""
+
+# seconds between status checks while a provider batch job is running
+BATCH_POLL_INTERVAL = 30
+
+# only the most recent steps are kept in the action history, older ones are not used by any prompt
+MAX_HISTORY = 32
+
+# LLM responses are cached in memory for the whole process, agents share this cache unless they are given their own
+_DEFAULT_CACHE = LLMCache()
 
  # this class will be based on the the data class
 @dataclass
@@ -43,25 +114,32 @@ class Episode:
 
 # this will identify the android agent 
 class AndroidAgent:
-    def __init__(self, model_name: str = "gpt-4", prompt_template: str = "base", api_key: str = None):
+    def __init__(self, model_name: str = "gpt-4", prompt_template: str = "base", api_key: str = None,
+                 use_cache: bool = True, cache: Optional[LLMCache] = None):
         self.model_name = model_name
         self.prompt_template = prompt_template
-        self.action_history = []
+        self.use_cache = use_cache
+        self.cache = (cache or _DEFAULT_CACHE) if use_cache else None
+        self.max_tokens = Config.TEMPLATE_MAX_TOKENS.get(prompt_template, Config.DEFAULT_MAX_TOKENS)
+        self.action_history = deque(maxlen=MAX_HISTORY)
         
         # This next part of the code will initialize the evaluator based on the andrioid agent
+        # the async clients are used when many episodes are evaluated concurrently
         if "gpt" in model_name.lower():
             self.client = openai.OpenAI(api_key=api_key)
+            self.async_client = openai.AsyncOpenAI(api_key=api_key)
             self.provider = "openai"
         elif "claude" in model_name.lower():
             self.client = Anthropic(api_key=api_key)
+            self.async_client = AsyncAnthropic(api_key=api_key)
             self.provider = "anthropic"
         else:
             raise ValueError(f"Unsupported model: {model_name}")
     
     """Generate next action given goal and current observation"""
     def generate_action(self, goal: str, observation: Dict, history: Optional[List] = None) -> str:
-        prompt = self._format_prompt(goal, observation, history)
-        response = self._call_llm(prompt)
+        system, user = self._format_prompt(goal, observation, history)
+        response = self._call_llm(system, user)
         action = self._parse_action(response)
         
         # then we need to store the data in the storage database
@@ -73,8 +151,112 @@ class AndroidAgent:
         
         return action
     
+    """Async version of generate_action so several episodes can wait on the LLM at once"""
+    async def agenerate_action(self, goal: str, observation: Dict, history: Optional[List] = None) -> str:
+        system, user = self._format_prompt(goal, observation, history)
+        response = await self._acall_llm(system, user)
+        action = self._parse_action(response)
+        
+        self.action_history.append({
+            'observation': observation,
+            'action': action,
+            'response': response
+        })
+        
+        return action
+    
+    # this function will generate the actions for many (goal, observation) pairs with a single provider batch job
+    # batch jobs are billed at about half the price of live calls but can take up to a day, so this is only for offline runs
+    def generate_actions_batch(self, requests: List[Tuple[str, Dict]], poll_interval: float = BATCH_POLL_INTERVAL) -> List[str]:
+        prompts = [self._format_prompt(goal, observation) for goal, observation in requests]
+        
+        # identical prompts are only sent once, and the ones that are already cached are not sent at all
+        responses = {}
+        pending = []
+        for prompt in dict.fromkeys(prompts):
+            if self.cache is not None:
+                key, namespace = self._cache_key(*prompt)
+                cached = self.cache.get(key, namespace, prompt[1])
+                if cached is not None:
+                    responses[prompt] = cached
+                    continue
+            pending.append(prompt)
+        
+        if pending:
+            try:
+                if self.provider == "openai":
+                    texts = self._run_openai_batch(pending, poll_interval)
+                else:
+                    texts = self._run_anthropic_batch(pending, poll_interval)
+            except Exception as e:
+                print(f"Error running LLM batch: {e}")
+                texts = {}
+            
+            # requests that failed inside the batch are treated like failed live calls
+            for i, prompt in enumerate(pending):
+                text = texts.get(i)
+                if text is None:
+                    responses[prompt] = "ERROR"
+                    continue
+                responses[prompt] = text
+                if self.cache is not None:
+                    key, namespace = self._cache_key(*prompt)
+                    self.cache.set(key, text, namespace, prompt[1])
+        
+        return [self._parse_action(responses[prompt]) for prompt in prompts]
+    
+    # this function will upload the requests as a JSONL file, wait for the OpenAI batch to finish and return the texts by request index
+    def _run_openai_batch(self, prompts: List[Tuple[str, str]], poll_interval: float) -> Dict[int, str]:
+        lines = [
+            json.dumps({
+                'custom_id': str(i),
+                'method': "POST",
+                'url': "/v1/chat/completions",
+                'body': self._request_params(system, user)
+            })
+            for i, (system, user) in enumerate(prompts)
+        ]
+        batch_file = self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode('utf-8')), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        
+        # an expired or cancelled batch can still have output for the requests that did finish
+        texts = {}
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                record = json.loads(line)
+                response = record.get('response')
+                if response and response.get('status_code') == 200:
+                    texts[int(record['custom_id'])] = response['body']['choices'][0]['message']['content'] or ""
+        return texts
+    
+    # this function will submit an Anthropic message batch, wait for it to end and return the texts by request index
+    def _run_anthropic_batch(self, prompts: List[Tuple[str, str]], poll_interval: float) -> Dict[int, str]:
+        batch = self.client.messages.batches.create(requests=[
+            {'custom_id': str(i), 'params': self._request_params(system, user)}
+            for i, (system, user) in enumerate(prompts)
+        ])
+        while batch.processing_status != "ended":
+            time.sleep(poll_interval)
+            batch = self.client.messages.batches.retrieve(batch.id)
+        
+        texts = {}
+        for entry in self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                texts[int(entry.custom_id)] = "".join(block.text for block in entry.result.message.content if block.type == "text")
+        return texts
+    
+    # this will make a copy of the agent that shares the API clients but keeps its own history
+    def fork(self) -> "AndroidAgent":
+        agent = copy.copy(self)
+        agent.action_history = deque(maxlen=MAX_HISTORY)
+        return agent
+    
     #this method will determine the format prompt based on the template that is chosen to give a the best final determination
-    def _format_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> str:
+    # every template returns a (system, user) pair, the system part is static and only the user part changes per step
+    def _format_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> Tuple[str, str]:
         if self.prompt_template == "base":
             return self._base_prompt(goal, observation)
         elif self.prompt_template == "few_shot":
@@ -84,102 +266,142 @@ class AndroidAgent:
         else:
             raise ValueError(f"Unknown prompt template: {self.prompt_template}")
     
+    # this function will yield the goal and observation, which is the part of the prompt that changes every step
+    def _observation_prompt(self, goal: str, observation: Dict) -> str:
+        ui_elements = tuple(observation.get('ui_elements', [])[:MAX_UI_ELEMENTS])
+        app_name = observation.get('app', 'Unknown')
+        return _observation_prompt_cached(goal, app_name, ui_elements)
+    
     # this function will yield the base prompt 
-    def _base_prompt(self, goal: str, observation: Dict) -> str:
+    def _base_prompt(self, goal: str, observation: Dict) -> Tuple[str, str]:
         """Basic prompt template"""
-        ui_elements = observation.get('ui_elements', [])
-        app_name = observation.get('app', 'Unknown')
-        
-        return f"""Goal: {goal}
-        Observation:
-        - App: {app_name}
-        - UI Elements: {ui_elements}
-        What is the next best action to achieve the goal? Respond in the format:
-        CLICK("element_name") or SCROLL("direction") or TYPE("text")
-        Action:"""
+        return _SYSTEM_PROMPT, self._observation_prompt(goal, observation) + "\nAction:"
     
     # this function will output the prmots based on the input prompts
-    def _few_shot_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> str:
+    def _few_shot_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> Tuple[str, str]:
         """Few-shot prompt with examples"""
-        examples = """Examples:
-Goal: Open calculator app
-Observation: App: Home, UI Elements: ["Calculator", "Settings", "Chrome"]
-Action: CLICK("Calculator")
-
-Goal: Uninstall app
-Observation: App: Settings, UI Elements: ["Apps", "Display", "Sound"]
-Action: CLICK("Apps")
-
-Goal: Send message "Hello"
-Observation: App: Messages, UI Elements: ["Compose", "Search", "Settings"]
-Action: CLICK("Compose")
-"""
-        
-        base_prompt = self._base_prompt(goal, observation)
-        return examples + "\n" + base_prompt
+        return _FEW_SHOT_SYSTEM, self._observation_prompt(goal, observation) + "\nAction:"
     
-    def _self_reflection_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> str:
+    def _self_reflection_prompt(self, goal: str, observation: Dict, history: Optional[List] = None) -> Tuple[str, str]:
         """Self-reflection prompt"""
-        base_prompt = self._base_prompt(goal, observation)
-        
-        reflection_prompt = """
-Before choosing an action, consider:
-1. What is the current state of the app?
-2. What UI elements are available?
-3. Which action will move me closer to the goal?
-4. Are there any intermediate steps needed?
-
-Reasoning: [Explain your thought process]
-Action: [Your chosen action]
-"""
-        
-        return base_prompt + reflection_prompt
+        return _SELF_REFLECTION_SYSTEM, self._observation_prompt(goal, observation)
      
+    # this function will build the request arguments for the provider so the sync and async calls stay identical
+    def _request_params(self, system: str, user: str) -> Dict:
+        if self.provider == "openai":
+            return {
+                'model': self.model_name,
+                'messages': [{"role": "system", "content": system}, {"role": "user", "content": user}],
+                'temperature': 0.1,
+                'max_tokens': self.max_tokens
+            }
+        # the system block is marked as cacheable so Anthropic can reuse the prefix between requests
+        return {
+            'model': self.model_name,
+            'max_tokens': self.max_tokens,
+            'temperature': 0.1,
+            'system': [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}],
+            'messages': [{"role": "user", "content": user}]
+        }
+    
+    # this function will build the cache key, the user message holds the goal and observation and the system message depends on the prompt template
+    def _cache_key(self, system: str, user: str) -> Tuple[str, str]:
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        key = LLMCache.make_key(f"{self.provider}:{self.model_name}", messages, 0.1, self.max_tokens)
+        namespace = f"{self.provider}:{self.model_name}:{self.prompt_template}"
+        return key, namespace
+    
     # The function will call the appropriate LLm API
-    def _call_llm(self, prompt: str) -> str:
+    # the response is streamed and the stream is closed as soon as an action can be parsed, so we do not wait for the rest of the decode
+    def _call_llm(self, system: str, user: str) -> str:
+        if self.cache is not None:
+            key, namespace = self._cache_key(system, user)
+            cached = self.cache.get(key, namespace, user)
+            if cached is not None:
+                return cached
+        text = ""
         try:
+            params = self._request_params(system, user)
             if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.1,
-                    max_tokens=150
-                )
-                return response.choices[0].message.content
-            
-            elif self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model_name,
-                    max_tokens=150,
-                    temperature=0.1,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
+                stream = self.client.chat.completions.create(stream=True, **params)
+                try:
+                    for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            text += delta
+                            # an action is only complete once its closing parenthesis has arrived
+                            if ")" in delta and _contains_action(text):
+                                break
+                finally:
+                    stream.close()
+            else:
+                with self.client.messages.stream(**params) as stream:
+                    for delta in stream.text_stream:
+                        text += delta
+                        if ")" in delta and _contains_action(text):
+                            break
        # need to handle any potental errors 
         except Exception as e:
             print(f"Error calling LLM: {e}")
             return "ERROR"
         
+        if self.cache is not None:
+            self.cache.set(key, text, namespace, user)
+        return text
+    
+    # a cache backed by SQLite is read on a worker thread instead of blocking the event loop, the in-memory one is called directly
+    async def _acall_llm(self, system: str, user: str) -> str:
+        if self.cache is not None:
+            key, namespace = self._cache_key(system, user)
+            if self.cache.blocking:
+                cached = await asyncio.to_thread(self.cache.get, key, namespace, user)
+            else:
+                cached = self.cache.get(key, namespace, user)
+            if cached is not None:
+                return cached
+        text = ""
+        try:
+            params = self._request_params(system, user)
+            if self.provider == "openai":
+                stream = await self.async_client.chat.completions.create(stream=True, **params)
+                try:
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            text += delta
+                            if ")" in delta and _contains_action(text):
+                                break
+                finally:
+                    await stream.close()
+            else:
+                async with self.async_client.messages.stream(**params) as stream:
+                    async for delta in stream.text_stream:
+                        text += delta
+                        if ")" in delta and _contains_action(text):
+                            break
+        except Exception as e:
+            print(f"Error calling LLM: {e}")
+            return "ERROR"
+        
+        if self.cache is not None:
+            if self.cache.blocking:
+                await asyncio.to_thread(self.cache.set, key, text, namespace, user)
+            else:
+                self.cache.set(key, text, namespace, user)
+        return text
+        
     # this function will extract action from the response of the large language model
     def _parse_action(self, response: str) -> str:
-        # Look for action patterns
-        action_patterns = [
-            r'CLICK\(["\']([^"\']*)["\']\)',
-            r'SCROLL\(["\']([^"\']*)["\']\)',
-            r'TYPE\(["\']([^"\']*)["\']\)',
-            r'SWIPE\(["\']([^"\']*)["\']\)'
-        ]
-        
-        # look through the patternes to see if there is a match and if there is match classify and add to the match group
-        for pattern in action_patterns:
-            match = re.search(pattern, response, re.IGNORECASE)
-            if match:
-                action_type = pattern.split('\\(')[0].replace('r\'', '')
-                return f'{action_type}("{match.group(1)}")'
+        # the first action in the response is classified and returned in the standard format
+        # the same few actions come back over and over, so they are interned before they are stored in the results
+        match = _PARSE_RE.search(response)
+        if match:
+            # the named group is the action type and the target is the group right after it
+            return sys.intern(f'{match.lastgroup}("{match.group(match.lastindex + 1)}")')
         
         # If no pattern matched, return the response as-is
         return response.strip()
     
     # All the agents need a reset for the new episode so the history will be set to 
     def reset_history(self):
-        self.action_history = []
\ No newline at end of file
+        self.action_history.clear()
\ No newline at end of file
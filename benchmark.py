@@ -10,7 +10,7 @@ across multiple models, prompt templates, and episodes in the Android World envi
 Key Components:
 - BenchmarkRunner: Main orchestration class for running evaluations
 - Single benchmark execution: Test one model-prompt combination
-- Comparative benchmarking: Test multiple configurations simultaneously
+- Comparative benchmarking: Test multiple configurations simultaneously, in one event loop or one process per configuration
 - Results aggregation: Collect and analyze performance metrics
 - Report generation: Create markdown reports with performance summaries
 
@@ -37,51 +37,82 @@ Usage:
 """
 
 import argparse
-import json
+import asyncio
+import multiprocessing
 import os
 import time
-from typing import List, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+
+import orjson
 
 from agent import AndroidAgent
 from environment import AndroidWorldEnvironment
 from evaluator import Evaluator
-from utils import Logger, ResultsAnalyzer
+from utils import Logger, ResultsAnalyzer, create_llm_cache
+
+# this is the most episodes that wait on the LLM APIs at the same time, shared by every configuration in a run
+MAX_IN_FLIGHT = 16
+
+# this function runs one configuration inside a worker process, it builds its own runner since runners hold a logger and clients that cannot be pickled
+def _run_config_worker(data_path: str, output_dir: str, use_cache: bool, cache_dir: Optional[str], config: Dict,
+                       episode_ids: List[str], fast_mode: bool, max_in_flight: int) -> Dict:
+    runner = BenchmarkRunner(data_path, output_dir, use_cache=use_cache, cache_dir=cache_dir)
+    return runner.run_single_config(config, episode_ids, fast_mode, max_in_flight)
 
 # Comprehensive benchmarking system for multiple models and prompts
 class BenchmarkRunner:
     
-    def __init__(self, data_path: str, output_dir: str = "results"):
+    def __init__(self, data_path: str, output_dir: str = "results", seed: Optional[int] = None,
+                 use_cache: bool = True, cache_dir: Optional[str] = None):
         self.data_path = data_path
         self.output_dir = output_dir
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        # one cache per runner so configurations evaluated in this process share their responses
+        self.cache = create_llm_cache(cache_dir) if use_cache else None
         self.logger = Logger()
         os.makedirs(output_dir, exist_ok=True)
         
         # Initialize environment
-        self.env = AndroidWorldEnvironment(data_path)
+        self.env = AndroidWorldEnvironment(data_path, seed)
     
     # this function will define the single benchmark model
+    # fast_mode stops each episode at its first wrong step, which saves API calls when only the success rate matters
+    # defer_plots skips the per-config plots, the comparative benchmark draws one figure for all configs instead
     def run_single_benchmark(self, model: str, prompt_template: str, api_key: str, 
-                           num_episodes: int = 10) -> Dict:
+                           num_episodes: int = 10, fast_mode: bool = False, defer_plots: bool = False) -> Dict:
+        # from the environment we can obtain the episodes 
+        episodes = self.env.get_random_episodes(num_episodes)
+        
         # this will run for a single model prompt combination
-        self.logger.logger.info(f"Starting benchmark: {model} with {prompt_template}")
+        result = asyncio.run(self._run_config_async(model, prompt_template, api_key, episodes, fast_mode))
+        
+        # Generate analysis that will be sent to the results file
+        if not defer_plots:
+            analyzer = ResultsAnalyzer(result['results_file'])
+            analyzer.generate_performance_plots(self.output_dir)
+        
+        return result
+    
+    # this function will evaluate one model prompt combination, the semaphore is shared when several configurations run together
+    async def _run_config_async(self, model: str, prompt_template: str, api_key: str, episodes: List,
+                                fast_mode: bool = False, semaphore: Optional[asyncio.Semaphore] = None) -> Dict:
+        self.logger.logger.info("Starting benchmark: %s with %s", model, prompt_template)
         
         # Initialize agent and evaluator from the agent.py file
-        agent = AndroidAgent(model, prompt_template, api_key)
+        agent = AndroidAgent(model, prompt_template, api_key, use_cache=self.use_cache, cache=self.cache)
         evaluator = Evaluator()
         
-        # from the environment we can obtain the episodes 
-        episodes = self.env.get_random_episodes(num_episodes)
-        
         # Run the evaluation
         start_time = time.time()
-        # loop through the episode from the evaluator as then log the end of the episode to show the results
-        for episode in episodes:
-            try:
-                result = evaluator.evaluate_episode(agent, episode)
-                self.logger.log_episode_end(episode.episode_id, result.episode_success, result.step_accuracy)
-            except Exception as e:
-                self.logger.log_error(str(e), f"Episode {episode.episode_id}")
+        # the episodes are independent so they are evaluated concurrently, then log the end of each episode to show the results
+        try:
+            results = await evaluator.aevaluate_episodes(agent, episodes, early_stop=fast_mode, semaphore=semaphore)
+            for result in results:
+                self.logger.log_episode_end(result.episode_id, result.episode_success, result.step_accuracy)
+        except Exception as e:
+            self.logger.log_error(str(e), f"Benchmark {model} with {prompt_template}")
         
         duration = time.time() - start_time
         
@@ -89,10 +120,6 @@ class BenchmarkRunner:
         results_file = os.path.join(self.output_dir, f"benchmark_{model}_{prompt_template}.json")
         evaluator.save_results(results_file)
         
-        # Generate analysis that will be sent to the results file
-        analyzer = ResultsAnalyzer(results_file)
-        analyzer.generate_performance_plots(self.output_dir)
-        
         return {
             'model': model,
             'prompt_template': prompt_template,
@@ -101,26 +128,70 @@ class BenchmarkRunner:
             'metrics': evaluator.calculate_aggregate_metrics()
         }
     
-    # the comparative benchmark function will run the comparison over multiple configurations
-    def run_comparative_benchmark(self, configs: List[Dict], num_episodes: int = 10) -> Dict:
-        # start the empty directory to store the results
-        all_results = []
+    # this function will run one configuration on the given episodes, it is what each worker process of a comparative run calls
+    def run_single_config(self, config: Dict, episode_ids: List[str], fast_mode: bool = False,
+                          max_in_flight: int = MAX_IN_FLIGHT) -> Dict:
+        episodes = [self.env.get_episode(episode_id) for episode_id in episode_ids]
+        
+        async def run() -> Dict:
+            semaphore = asyncio.Semaphore(max_in_flight)
+            return await self._run_config_async(config['model'], config['prompt_template'], config['api_key'],
+                                                episodes, fast_mode, semaphore)
+        
+        return asyncio.run(run())
+    
+    # this function will run every configuration in its own process, the processes only share the sampled episode ids
+    def _run_in_processes(self, configs: List[Dict], num_episodes: int, fast_mode: bool, processes: int) -> List[Dict]:
+        episode_ids = [episode.episode_id for episode in self.env.get_random_episodes(num_episodes)]
+        # the global limit of requests in flight is split between the processes
+        max_in_flight = max(1, MAX_IN_FLIGHT // min(processes, len(configs)))
+        
+        # spawn starts clean interpreters, forking a process that already runs the logging listener thread is not safe
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_run_config_worker, self.data_path, self.output_dir, self.use_cache, self.cache_dir, config, episode_ids, fast_mode, max_in_flight)
+                for config in configs
+            ]
+            return [future.result() for future in futures]
+    
+    # this function will run every (configuration, episode) pair at once under one global limit of requests in flight
+    async def run_async(self, configs: List[Dict], num_episodes: int = 10, fast_mode: bool = False) -> List[Dict]:
+        semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+        # every configuration is evaluated on the same episodes so the results can be compared directly
+        episodes = list(self.env.get_random_episodes(num_episodes))
         
-        # then loop through all configurations which then the results will be appeneded to the result dictionary
-        for config in configs:
-            result = self.run_single_benchmark(
+        return await asyncio.gather(*(
+            self._run_config_async(
                 config['model'],
                 config['prompt_template'],
                 config['api_key'],
-                num_episodes
+                episodes,
+                fast_mode,
+                semaphore
             )
-            all_results.append(result)
+            for config in configs
+        ))
+    
+    # the comparative benchmark function will run the comparison over multiple configurations
+    # with processes > 1 the configurations run in separate worker processes, otherwise all of them share one event loop
+    # plots=False leaves the comparative figure to the caller, for example to draw it off the critical path
+    def run_comparative_benchmark(self, configs: List[Dict], num_episodes: int = 10, fast_mode: bool = False,
+                                  processes: int = 1, plots: bool = True) -> Dict:
+        # the results come back in the same order as the configurations
+        if processes > 1 and len(configs) > 1:
+            all_results = self._run_in_processes(configs, num_episodes, fast_mode, processes)
+        else:
+            all_results = asyncio.run(self.run_async(configs, num_episodes, fast_mode))
         
         # Generate comparative analysis into a file in the results directory
         comparison_file = os.path.join(self.output_dir, "comparative_analysis.json")
         # write into the generatve analysis file
-        with open(comparison_file, 'w') as f:
-            json.dump(all_results, f, indent=2)
+        with open(comparison_file, 'wb') as f:
+            f.write(orjson.dumps(all_results, option=orjson.OPT_INDENT_2))
+        
+        # one figure compares all the configurations
+        if plots:
+            ResultsAnalyzer.generate_comparative_plots(all_results, self.output_dir)
         
         return {
             'results': all_results,
@@ -143,19 +214,22 @@ class BenchmarkRunner:
             f.write("| Model | Prompt Template | Success Rate | Step Accuracy | Duration |\n")
             f.write("|-------|----------------|--------------|---------------|----------|\n")
             
-            # loop through the benchmark results along with the model and API that is used
+            # loop through the benchmark results along with the model and API that is used, keeping track of the best one on the way
+            best_config = None
+            best_rate = -1.0
             for result in benchmark_results['results']:
                 metrics = result['metrics']
+                rate = metrics.get('episode_success_rate', 0)
                 f.write(f"| {result['model']} | {result['prompt_template']} | "
-                       f"{metrics.get('episode_success_rate', 0):.2%} | "
+                       f"{rate:.2%} | "
                        f"{metrics.get('average_step_accuracy', 0):.2%} | "
                        f"{result['duration']:.1f}s |\n")
+                if rate > best_rate:
+                    best_config, best_rate = result, rate
             
             # this snppet of code will highlight the best performing configuration with the written declaration in the final report
             f.write("\n## Best Performing Configuration\n\n")
-            best_config = max(benchmark_results['results'], 
-                            key=lambda x: x['metrics'].get('episode_success_rate', 0))
             f.write(f"**Model**: {best_config['model']}\n")
             f.write(f"**Prompt Template**: {best_config['prompt_template']}\n")
-            f.write(f"**Success Rate**: {best_config['metrics'].get('episode_success_rate', 0):.2%}\n")
+            f.write(f"**Success Rate**: {best_rate:.2%}\n")
             f.write(f"**Step Accuracy**: {best_config['metrics'].get('average_step_accuracy', 0):.2%}\n")
\ No newline at end of file
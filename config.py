@@ -8,6 +8,7 @@ of truth for model specifications, evaluation parameters, and system settings.
 Key Components:
 - SUPPORTED_MODELS: Dictionary of available LLM models with their configurations
 - PROMPT_TEMPLATES: Available prompting strategies for agent behavior
+- FAST_MODEL_FOR_TEMPLATE / TEMPLATE_MAX_TOKENS: Default model and completion budget for each prompt template
 - File path configurations: Directory structures for results, logs, and prompts
 - Action parsing patterns: Regular expressions for extracting actions from LLM responses
 - Evaluation metrics: List of performance metrics to calculate and track
@@ -26,16 +27,32 @@ from typing import Dict, List
 @dataclass
 class Config:
     # First we have highlight the model configurations
+    # the completion budget depends on the prompt template, see TEMPLATE_MAX_TOKENS
     SUPPORTED_MODELS = {
-        "gpt-4": {"provider": "openai", "max_tokens": 150},
-        "gpt-3.5-turbo": {"provider": "openai", "max_tokens": 150},
-        "claude-3-opus": {"provider": "anthropic", "max_tokens": 150},
-        "claude-3-sonnet": {"provider": "anthropic", "max_tokens": 150}
+        "gpt-4": {"provider": "openai"},
+        "gpt-3.5-turbo": {"provider": "openai"},
+        "claude-3-opus": {"provider": "anthropic"},
+        "claude-3-sonnet": {"provider": "anthropic"}
     }
     
     # This element will be the templates possible for the prompts
     PROMPT_TEMPLATES = ["base", "few_shot", "self_reflection"]
     
+    # the templates that only need a single action default to the smaller and faster model
+    FAST_MODEL_FOR_TEMPLATE = {
+        "base": "gpt-3.5-turbo",
+        "few_shot": "gpt-3.5-turbo",
+        "self_reflection": "gpt-4"
+    }
+    
+    # base and few-shot answers are a single action, only self-reflection needs room to reason before the action
+    TEMPLATE_MAX_TOKENS = {
+        "base": 24,
+        "few_shot": 24,
+        "self_reflection": 150
+    }
+    DEFAULT_MAX_TOKENS = 150
+    
     # This will set the episode benchmarks
     DEFAULT_NUM_EPISODES = 10
     MIN_EPISODES_FOR_BENCHMARK = 10
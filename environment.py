@@ -26,42 +26,64 @@ Each episode JSON file should contain:
 - episode_id: Unique identifier (derived from filename)
 
 """
-import json
 import os
-from typing import List, Dict
+import random
+import sys
+from functools import lru_cache
+from typing import Iterator, List, Dict, Optional
+
+import orjson
+
+from agent import Episode
+
+
+# this will parse a single episode file
+def _parse_episode(path: str) -> Episode:
+    with open(path, 'rb') as f:
+        data = orjson.loads(f.read())
+    # goals and ground-truth actions repeat across episodes, interning keeps a single copy of each distinct string
+    return Episode(
+        goal=sys.intern(data.get('goal', '')),
+        observations=data.get('observations', []),
+        actions=[sys.intern(action) for action in data.get('actions', [])],
+        episode_id=os.path.basename(path).replace('.json', '')
+    )
+
+
+# this will keep the episodes looked up by ID, repeat lookups skip the file read while sampled episodes are never held here
+@lru_cache(maxsize=256)
+def _load_episode(path: str) -> Episode:
+    return _parse_episode(path)
+
 
 class AndroidWorldEnvironment:
-    def __init__(self, data_path: str):
+    def __init__(self, data_path: str, seed: Optional[int] = None):
         self.data_path = data_path
-        self.episodes = self._load_episodes()
+        # the environment keeps its own random generator so a seed makes the episode sampling reproducible
+        self._rng = random.Random(seed)
+        # only the file paths are collected up front, the episodes are parsed when they are requested
+        self._episode_files = self._scan_episode_files()
     
-    def _load_episodes(self) -> List[Episode]:
-        """Load episodes from android_world dataset"""
-        episodes = []
-        
+    def _scan_episode_files(self) -> List[str]:
+        """Find the episode files in the android_world dataset"""
         # This is a placeholder - adapt based on actual android_world data structure
-        for filename in os.listdir(self.data_path):
-            if filename.endswith('.json'):
-                with open(os.path.join(self.data_path, filename), 'r') as f:
-                    data = json.load(f)
-                    episode = Episode(
-                        goal=data.get('goal', ''),
-                        observations=data.get('observations', []),
-                        actions=data.get('actions', []),
-                        episode_id=filename.replace('.json', '')
-                    )
-                    episodes.append(episode)
-        
-        return episodes
+        with os.scandir(self.data_path) as entries:
+            return sorted(entry.path for entry in entries if entry.name.endswith('.json'))
+    
+    def __len__(self) -> int:
+        """Number of episodes in the dataset"""
+        return len(self._episode_files)
     
     def get_episode(self, episode_id: str) -> Episode:
         """Get specific episode by ID"""
-        for episode in self.episodes:
-            if episode.episode_id == episode_id:
-                return episode
+        for path in self._episode_files:
+            if os.path.basename(path) == f"{episode_id}.json":
+                return _load_episode(path)
         raise ValueError(f"Episode {episode_id} not found")
     
-    def get_random_episodes(self, n: int) -> List[Episode]:
+    def get_random_episodes(self, n: int) -> Iterator[Episode]:
         """Get n random episodes for evaluation"""
-        import random
-        return random.sample(self.episodes, min(n, len(self.episodes)))
\ No newline at end of file
+        # the sample is drawn right away so the seeded generator gives the same episodes however the result is consumed
+        # the episodes themselves are only parsed as they are iterated, so callers that stream them never hold them all
+        paths = self._rng.sample(self._episode_files, min(n, len(self._episode_files)))
+        return (_parse_episode(path) for path in paths)
\ No newline at end of file
@@ -34,13 +34,19 @@ Usage:
     metrics = evaluator.calculate_aggregate_metrics()
     evaluator.save_results("results.json")
 """
-import json
-from typing import List, Dict, Tuple
+import asyncio
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 
+import orjson
+
 from agent import AndroidAgent
 from agent import Episode
 
+# quotes and whitespace are stripped before the fuzzy comparison of two actions
+_STRIP_TABLE = str.maketrans('', '', '"\' \t\n\r\v\f')
+
 # this class is denoted as the data class which will be the precursor for the types of variables that are needed
 @dataclass
 class EvaluationResult:
@@ -50,17 +56,31 @@ class EvaluationResult:
     episode_success: bool
     total_steps: int
     correct_steps: int
+    steps_evaluated: int
     agent_actions: List[str]
     ground_truth_actions: List[str]
     failure_points: List[int]
 
 # we also need a class that will be the placeholder for the evaluator
 class Evaluator:
-    def __init__(self):
+    def __init__(self, keep_results: bool = True):
+        # without keep_results only the running totals are updated, so memory stays the same however many episodes run
+        # the episodes then have to be written out by the caller as they finish, see save_results
+        self.keep_results = keep_results
         self.results = []
+        # episodes can be evaluated from several threads at once, so the results are appended under a lock
+        self._lock = threading.Lock()
+        # running totals for the aggregate metrics and the failure analysis, updated as every episode is recorded
+        self._num_episodes = 0
+        self._successful_episodes = 0
+        self._accuracy_sum = 0.0
+        self._total_steps = 0
+        self._total_correct_steps = 0
+        self._failure_types: Dict[str, int] = {}
     
     # this function will evaluate the perfromance of each agent on a single episode
-    def evaluate_episode(self, agent: AndroidAgent, episode: Episode) -> EvaluationResult:
+    # with early_stop the episode ends at the first wrong step, which is enough when only the success rate is needed
+    def evaluate_episode(self, agent: AndroidAgent, episode: Episode, early_stop: bool = False) -> EvaluationResult:
         agent.reset_history()
         agent_actions = []
         correct_steps = 0
@@ -84,10 +104,95 @@ class Evaluator:
                 print(f"Error generating action for step {i}: {e}")
                 agent_actions.append("ERROR")
                 failure_points.append(i)
+            
+            if early_stop and failure_points:
+                break
+        
+        return self._finalize_result(episode, agent_actions, correct_steps, failure_points, early_stop)
+    
+    # this is the async version of evaluate_episode, the steps stay sequential since each one depends on the last
+    async def aevaluate_episode(self, agent: AndroidAgent, episode: Episode, early_stop: bool = False) -> EvaluationResult:
+        agent.reset_history()
+        agent_actions = []
+        correct_steps = 0
+        failure_points = []
+        
+        for i, observation in enumerate(episode.observations[:-1]):
+            try:
+                action = await agent.agenerate_action(episode.goal, observation)
+                agent_actions.append(action)
+                
+                if i < len(episode.actions):
+                    ground_truth = episode.actions[i]
+                    if self._actions_match(action, ground_truth):
+                        correct_steps += 1
+                    else:
+                        failure_points.append(i)
+            except Exception as e:
+                print(f"Error generating action for step {i}: {e}")
+                agent_actions.append("ERROR")
+                failure_points.append(i)
+            
+            if early_stop and failure_points:
+                break
+        
+        return self._finalize_result(episode, agent_actions, correct_steps, failure_points, early_stop)
+    
+    # this function will run independent episodes concurrently, bounded by a semaphore so we stay under the API rate limits
+    # a semaphore can be passed in so several evaluators share one limit
+    async def aevaluate_episodes(self, agent: AndroidAgent, episodes: List[Episode],
+                                 max_concurrency: int = 8, early_stop: bool = False,
+                                 semaphore: Optional[asyncio.Semaphore] = None) -> List[EvaluationResult]:
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max_concurrency)
         
+        async def run(episode: Episode) -> EvaluationResult:
+            async with semaphore:
+                # every episode gets its own copy of the agent so the histories do not mix
+                return await self.aevaluate_episode(agent.fork(), episode, early_stop)
+        
+        return await asyncio.gather(*(run(episode) for episode in episodes))
+    
+    # this function will evaluate the episodes with one provider batch job instead of live calls
+    # every step has a recorded observation and no prompt depends on the earlier actions, so all steps of all episodes are sent at once
+    def evaluate_episodes_batch(self, agent: AndroidAgent, episodes: List[Episode], early_stop: bool = False) -> List[EvaluationResult]:
+        requests = [(episode.goal, observation) for episode in episodes for observation in episode.observations[:-1]]
+        actions = agent.generate_actions_batch(requests)
+        
+        results = []
+        offset = 0
+        for episode in episodes:
+            num_steps = max(len(episode.observations) - 1, 0)
+            agent_actions = []
+            correct_steps = 0
+            failure_points = []
+            
+            for i, action in enumerate(actions[offset:offset + num_steps]):
+                agent_actions.append(action)
+                if i < len(episode.actions):
+                    if self._actions_match(action, episode.actions[i]):
+                        correct_steps += 1
+                    else:
+                        failure_points.append(i)
+                
+                # the calls were already made, early_stop only keeps the scoring the same as in live mode
+                if early_stop and failure_points:
+                    break
+            offset += num_steps
+            
+            results.append(self._finalize_result(episode, agent_actions, correct_steps, failure_points, early_stop))
+        return results
+    
+    def _finalize_result(self, episode: Episode, agent_actions: List[str], correct_steps: int,
+                         failure_points: List[int], early_stop: bool = False) -> EvaluationResult:
         # Calculate metrics
         total_steps = len(episode.actions)
-        step_accuracy = correct_steps / total_steps if total_steps > 0 else 0
+        steps_evaluated = len(agent_actions)
+        # when the episode can stop early the accuracy is measured over the steps that were actually run
+        if early_stop:
+            step_accuracy = correct_steps / steps_evaluated if steps_evaluated > 0 else 0
+        else:
+            step_accuracy = correct_steps / total_steps if total_steps > 0 else 0
         episode_success = len(failure_points) == 0
         
         # this variable is the comphensive stroage of each of the results that is quanitfied for the 
@@ -98,14 +203,41 @@ class Evaluator:
             episode_success=episode_success,
             total_steps=total_steps,
             correct_steps=correct_steps,
+            steps_evaluated=steps_evaluated,
             agent_actions=agent_actions,
             ground_truth_actions=episode.actions,
             failure_points=failure_points
         )
         
-        self.results.append(result)
+        self.record_result(result)
         return result
     
+    # this function will add a finished episode to the running totals, so the aggregate metrics never walk the results again
+    def record_result(self, result: EvaluationResult):
+        with self._lock:
+            if self.keep_results:
+                self.results.append(result)
+            self._num_episodes += 1
+            self._successful_episodes += result.episode_success
+            self._accuracy_sum += result.step_accuracy
+            self._total_steps += result.total_steps
+            self._total_correct_steps += result.correct_steps
+            self._count_failures(result)
+    
+    # this function will add the failure points of one episode to the failure type counts, it is called with the lock held
+    def _count_failures(self, result: EvaluationResult):
+        if result.episode_success:
+            return
+        # Analyze failure points
+        for fp in result.failure_points:
+            if fp < len(result.agent_actions):
+                agent_action = result.agent_actions[fp]
+                if "ERROR" in agent_action:
+                    self._failure_types["llm_error"] = self._failure_types.get("llm_error", 0) + 1
+                elif "CLICK" in agent_action:
+                    self._failure_types["wrong_click"] = self._failure_types.get("wrong_click", 0) + 1
+                # Add more failure type analysis
+    
     def _actions_match(self, agent_action: str, ground_truth: str) -> bool:
         """Check if agent action matches ground truth"""
         # Exact match
@@ -114,64 +246,71 @@ class Evaluator:
         
         # Fuzzy match (could be improved)
         # Remove quotes and spaces for comparison
-        agent_clean = re.sub(r'["\s]', '', agent_action.lower())
-        truth_clean = re.sub(r'["\s]', '', ground_truth.lower())
+        agent_clean = agent_action.lower().translate(_STRIP_TABLE)
+        truth_clean = ground_truth.lower().translate(_STRIP_TABLE)
         
         return agent_clean == truth_clean
     
     def calculate_aggregate_metrics(self) -> Dict:
         """Calculate aggregate metrics across all episodes"""
-        if not self.results:
-            return {}
-        
-        total_episodes = len(self.results)
-        successful_episodes = sum(1 for r in self.results if r.episode_success)
-        avg_step_accuracy = sum(r.step_accuracy for r in self.results) / total_episodes
-        
-        return {
-            'total_episodes': total_episodes,
-            'episode_success_rate': successful_episodes / total_episodes,
-            'average_step_accuracy': avg_step_accuracy,
-            'total_steps': sum(r.total_steps for r in self.results),
-            'total_correct_steps': sum(r.correct_steps for r in self.results)
-        }
+        with self._lock:
+            total_episodes = self._num_episodes
+            if not total_episodes:
+                return {}
+            return {
+                'total_episodes': total_episodes,
+                'episode_success_rate': self._successful_episodes / total_episodes,
+                'average_step_accuracy': self._accuracy_sum / total_episodes,
+                'total_steps': self._total_steps,
+                'total_correct_steps': self._total_correct_steps
+            }
     
     def generate_failure_analysis(self) -> Dict:
         """Analyze common failure patterns"""
-        failure_types = {}
-        
-        for result in self.results:
-            if not result.episode_success:
-                # Analyze failure points
-                for fp in result.failure_points:
-                    if fp < len(result.agent_actions):
-                        agent_action = result.agent_actions[fp]
-                        if "ERROR" in agent_action:
-                            failure_types["llm_error"] = failure_types.get("llm_error", 0) + 1
-                        elif "CLICK" in agent_action:
-                            failure_types["wrong_click"] = failure_types.get("wrong_click", 0) + 1
-                        # Add more failure type analysis
-        
-        return failure_types
+        with self._lock:
+            return dict(self._failure_types)
     
-    def save_results(self, filepath: str):
-        """Save evaluation results to file"""
-        results_dict = {
-            'aggregate_metrics': self.calculate_aggregate_metrics(),
-            'failure_analysis': self.generate_failure_analysis(),
-            'episode_results': [
-                {
-                    'episode_id': r.episode_id,
-                    'goal': r.goal,
-                    'step_accuracy': r.step_accuracy,
-                    'episode_success': r.episode_success,
-                    'total_steps': r.total_steps,
-                    'correct_steps': r.correct_steps,
-                    'failure_points': r.failure_points
-                }
-                for r in self.results
-            ]
+    @staticmethod
+    def result_to_dict(result: EvaluationResult) -> Dict:
+        """Convert one episode result to the dict stored in the results files"""
+        return {
+            'episode_id': result.episode_id,
+            'goal': result.goal,
+            'step_accuracy': result.step_accuracy,
+            'episode_success': result.episode_success,
+            'total_steps': result.total_steps,
+            'correct_steps': result.correct_steps,
+            'steps_evaluated': result.steps_evaluated,
+            'failure_points': result.failure_points
         }
+    
+    @staticmethod
+    def _read_stream(stream_file: str) -> Iterator[Dict]:
+        """Episode records of a JSON Lines results stream, without its aggregate metrics line"""
+        with open(stream_file, 'rb') as f:
+            for line in f:
+                record = orjson.loads(line)
+                if 'aggregate_metrics' not in record:
+                    yield record
+    
+    # this function will save the results, when they were not kept the episodes are copied from the JSON Lines stream one at a time
+    def save_results(self, filepath: str, stream_file: Optional[str] = None):
+        """Save evaluation results to file"""
+        if stream_file is not None:
+            episode_results: Iterable[Dict] = self._read_stream(stream_file)
+        else:
+            episode_results = (self.result_to_dict(r) for r in self.results)
         
-        with open(filepath, 'w') as f:
-            json.dump(results_dict, f, indent=2)
\ No newline at end of file
+        # the file is written piece by piece so the episode list is never built in memory,
+        # the layout is the same as dumping the whole dict with OPT_INDENT_2
+        header = orjson.dumps({
+            'aggregate_metrics': self.calculate_aggregate_metrics(),
+            'failure_analysis': self.generate_failure_analysis()
+        }, option=orjson.OPT_INDENT_2)
+        with open(filepath, 'wb') as f:
+            f.write(header[:-2] + b',\n  "episode_results": [')
+            separator = b'\n    '
+            for record in episode_results:
+                f.write(separator + orjson.dumps(record, option=orjson.OPT_INDENT_2).replace(b'\n', b'\n    '))
+                separator = b',\n    '
+            f.write(b']\n}' if separator == b'\n    ' else b'\n  ]\n}')
\ No newline at end of file
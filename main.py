@@ -12,74 +12,136 @@ Key Features:
 - Prompt template selection (base, few-shot, self-reflection)
 - Customizable episode sampling size
 - Real-time progress tracking and results summary
-- Automatic results saving in JSON format
+- Automatic results saving in JSON format, with each episode also streamed to a JSON Lines file as it completes
 
 Arguments:
 - --data_path: Path to Android World dataset directory (required)
-- --model: LLM model to use (default: gpt-4)
+- --model: LLM model to use (default: gpt-3.5-turbo for base/few_shot, gpt-4 for self_reflection)
 - --prompt_template: Prompting strategy to use (base/few_shot/self_reflection)
 - --num_episodes: Number of episodes to evaluate (default: 10)
 - --api_key: API key for the selected LLM service (required)
 - --output_dir: Directory for saving results (default: results/)
+- --seed: Random seed for reproducible episode sampling (default: none)
+- --workers: Number of episodes evaluated in parallel (default: 8)
+- --execution_mode: live calls per step, or one provider batch job for all steps at about half the cost (default: live)
+- --no_cache: Disable the LLM response cache
+- --cache_dir: Also keep cached LLM responses on disk, under --output_dir when given without a value (default: memory only)
 
 Usage Examples:
-    # Basic GPT-4 evaluation
+    # Basic evaluation, runs gpt-3.5-turbo for the base template
     python main.py --data_path android_world_data/ --api_key sk-...
     
     # Claude with few-shot prompting
     python main.py --data_path android_world_data/ --model claude-3-sonnet 
                    --prompt_template few_shot --api_key your_anthropic_key
     
+    # GPT-4 evaluation
+    python main.py --data_path android_world_data/ --model gpt-4 --api_key sk-...
+    
     # Extended evaluation with 25 episodes
     python main.py --data_path android_world_data/ --num_episodes 25 --api_key sk-...
 """
 import argparse
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import orjson
+
 from agent import AndroidAgent
+from config import Config
 from environment import AndroidWorldEnvironment
 from evaluator import Evaluator
+from utils import create_llm_cache
+
+# this function will print one finished episode and append it to the JSON Lines stream
+def _report_result(results_fp, index: int, total: int, goal: str, result):
+    print(f"Episode {index+1}/{total}: {goal}")
+    print(f"  Step accuracy: {result.step_accuracy:.2f}, Success: {result.episode_success}")
+    results_fp.write(orjson.dumps(Evaluator.result_to_dict(result)) + b"\n")
+    results_fp.flush()
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate LLM agents on Android World")
     parser.add_argument("--data_path", required=True, help="Path to android_world dataset")
-    parser.add_argument("--model", default="gpt-4", help="Model to use (gpt-4, claude-3)")
+    parser.add_argument("--model", default=None, help="Model to use (gpt-4, claude-3), defaults to a fast model for the prompt template")
     parser.add_argument("--prompt_template", default="base", choices=["base", "few_shot", "self_reflection"])
     parser.add_argument("--num_episodes", type=int, default=10, help="Number of episodes to evaluate")
     parser.add_argument("--api_key", required=True, help="API key for LLM")
     parser.add_argument("--output_dir", default="results", help="Output directory for results")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible episode sampling")
+    parser.add_argument("--workers", type=int, default=8, help="Number of episodes evaluated in parallel")
+    parser.add_argument("--execution_mode", default="live", choices=["live", "batch"],
+                        help="live calls the LLM per step, batch sends all steps as one provider batch job")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the LLM response cache")
+    parser.add_argument("--cache_dir", nargs="?", const="", default=None,
+                        help="Also keep cached LLM responses on disk in this directory (defaults to --output_dir when given without a value)")
     
     args = parser.parse_args()
+    if args.model is None:
+        args.model = Config.FAST_MODEL_FOR_TEMPLATE[args.prompt_template]
     
     # Create output directory
     os.makedirs(args.output_dir, exist_ok=True)
     
     # Initialize components
-    env = AndroidWorldEnvironment(args.data_path)
-    agent = AndroidAgent(args.model, args.prompt_template, args.api_key)
-    evaluator = Evaluator()
+    env = AndroidWorldEnvironment(args.data_path, args.seed)
+    cache_dir = args.output_dir if args.cache_dir == "" else args.cache_dir
+    agent = AndroidAgent(args.model, args.prompt_template, args.api_key, use_cache=not args.no_cache,
+                         cache=None if args.no_cache else create_llm_cache(cache_dir))
+    # the episodes are streamed to the JSON Lines file below, so the evaluator only keeps the running totals
+    evaluator = Evaluator(keep_results=False)
     
-    # Get episodes to evaluate
+    # Get episodes to evaluate, they are parsed one at a time as the evaluation consumes them
     episodes = env.get_random_episodes(args.num_episodes)
+    num_episodes = min(args.num_episodes, len(env))
     
-    print(f"Evaluating {len(episodes)} episodes with {args.model} using {args.prompt_template} prompting...")
+    print(f"Evaluating {num_episodes} episodes with {args.model} using {args.prompt_template} prompting...")
     
-    # Run evaluation
-    for i, episode in enumerate(episodes):
-        print(f"Episode {i+1}/{len(episodes)}: {episode.goal}")
-        result = evaluator.evaluate_episode(agent, episode)
-        print(f"  Step accuracy: {result.step_accuracy:.2f}, Success: {result.episode_success}")
-    
-    # Save results
     # have to fix the directory
     results_file = os.path.join(args.output_dir, f"results_{args.model}_{args.prompt_template}.json")
-    evaluator.save_results(results_file)
+    stream_file = os.path.splitext(results_file)[0] + ".jsonl"
+    
+    # every finished episode is appended to a JSON Lines file right away so a crash does not lose the finished ones
+    with open(stream_file, "wb") as results_fp:
+        if args.execution_mode == "batch":
+            # all the steps go out as one batch job, so every result arrives once the provider has finished the job
+            print("Waiting for the batch job to finish, this can take a while...")
+            # the batch job needs every step up front, so here the episodes are all loaded
+            episodes = list(episodes)
+            results = evaluator.evaluate_episodes_batch(agent, episodes)
+            for i, (episode, result) in enumerate(zip(episodes, results)):
+                _report_result(results_fp, i, num_episodes, episode.goal, result)
+        else:
+            # Run evaluation, the episodes spend most of their time waiting on the LLM API so several run at once on worker threads
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                # episodes are only taken from the generator when a slot frees up, so at most twice the worker count are loaded at once
+                max_in_flight = 2 * args.workers
+                futures = {}
+                completed = 0
+                for episode in episodes:
+                    if len(futures) >= max_in_flight:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _report_result(results_fp, completed, num_episodes, futures.pop(future).goal, future.result())
+                            completed += 1
+                    # every episode gets its own copy of the agent so the action histories do not mix between threads
+                    futures[executor.submit(evaluator.evaluate_episode, agent.fork(), episode)] = episode
+                for future in as_completed(futures):
+                    _report_result(results_fp, completed, num_episodes, futures[future].goal, future.result())
+                    completed += 1
+        
+        # the last line holds the aggregate metrics, so readers of the stream do not have to add the episodes up again
+        metrics = evaluator.calculate_aggregate_metrics()
+        results_fp.write(orjson.dumps({'aggregate_metrics': metrics}) + b"\n")
+    
+    # Save results, the episodes are copied from the stream instead of being held until the end of the run
+    evaluator.save_results(results_file, stream_file)
     
     # Print summary
-    metrics = evaluator.calculate_aggregate_metrics()
     print("\nSummary:")
     print(f"Episode success rate: {metrics['episode_success_rate']:.2f}")
     print(f"Average step accuracy: {metrics['average_step_accuracy']:.2f}")
-    print(f"Results saved to: {results_file}")
+    print(f"Results saved to: {results_file} (per-episode stream: {stream_file})")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,9 +6,10 @@ agents on Android World benchmarks. The framework tests how well LLMs can intera
 with Android applications through UI actions like clicking, scrolling, and typing.
 
 Key Components:
-- Logger: Structured logging for episode tracking, action recording, and error handling
-- ActionParser: Parses and validates LLM responses into structured Android UI actions
+- Logger: Structured logging for episode tracking, action recording, and error handling, written as NDJSON records
+- ActionParser: Parses and validates LLM responses into structured Android UI actions (ParsedAction)
 - ResultsAnalyzer: Generates performance visualizations and failure analysis reports
+- LLMCache: Exact and optional semantic cache for LLM responses, in memory by default and optionally in SQLite
 
 Core Functionality:
 1. ACTION PARSING: Converts natural language LLM responses into structured Android 
@@ -35,46 +36,325 @@ through detailed performance analytics and failure mode analysis.
 Usage: Typically imported by main benchmark runners that coordinate episode execution,
 action validation, and result aggregation across multiple evaluation configurations.
 """
-"""
 
+import argparse
+import atexit
+import hashlib
+import heapq
 import json
 import re
 import os
 import logging
-from typing import Dict, List, Any, Optional
+import logging.handlers
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Protocol, Sequence, Tuple
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
+from functools import lru_cache
+import numpy as np
+import orjson
+
+# matplotlib is only imported when a plot is drawn, so the CLI and worker processes that never plot do not pay for it
+def _pyplot():
+    import matplotlib
+    # the non-interactive backend writes image files without probing for a display
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+    return plt
+
+class NDJSONHandler(logging.Handler):
+    """Log handler that writes every record as one JSON line to a buffered binary file"""
+    
+    def __init__(self, path: str, buffer_size: int = 1 << 20):
+        super().__init__()
+        self._file = open(path, 'ab', buffering=buffer_size)
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._file.write(orjson.dumps({
+                't': record.created,
+                'lvl': record.levelname,
+                'msg': record.getMessage()
+            }) + b"\n")
+        except Exception:
+            self.handleError(record)
+    
+    def flush(self):
+        with self.lock:
+            self._file.flush()
+    
+    def close(self):
+        with self.lock:
+            self._file.close()
+        super().close()
 
 class Logger:
     """Custom logging utility for the evaluation framework"""
     
     def __init__(self, log_dir: str = "results/logs"):
         os.makedirs(log_dir, exist_ok=True)
-        self.log_file = os.path.join(log_dir, f"evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+        # the log file holds one JSON record per line so it can be loaded back with orjson for analysis
+        # the process id keeps the benchmark worker processes from appending to the same buffered file
+        self.log_file = os.path.join(log_dir, f"evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.ndjson")
         
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.log_file),
-                logging.StreamHandler()
-            ]
-        )
+        # like basicConfig, the handlers are only set up by the first Logger in the process
+        if not logging.getLogger().handlers:
+            # the evaluation threads only put records on a queue, a listener thread does the file and console writes
+            log_queue = queue.SimpleQueue()
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            # the queue handler only merges the arguments into the message, the listener's handlers add the time and level
+            queue_handler.setFormatter(logging.Formatter('%(message)s'))
+            
+            # the console keeps the readable format, the file gets the structured records
+            file_handler = NDJSONHandler(self.log_file)
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            
+            listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+            listener.start()
+            # stopping the listener writes out the records that are still queued when the process exits,
+            # logging's own exit hook runs after it and flushes the file buffer
+            atexit.register(listener.stop)
+            logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
         self.logger = logging.getLogger(__name__)
     
+    # the messages use the logging module's % arguments so nothing is formatted when the level is filtered out
     def log_episode_start(self, episode_id: str, goal: str):
-        self.logger.info(f"Starting episode {episode_id}: {goal}")
+        self.logger.info("Starting episode %s: %s", episode_id, goal)
     
     def log_action(self, step: int, observation: Dict, action: str, ground_truth: str, match: bool):
-        self.logger.info(f"Step {step}: Action='{action}', Truth='{ground_truth}', Match={match}")
+        # this is called for every step, so the call is skipped entirely when info is disabled
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("Step %d: Action='%s', Truth='%s', Match=%s", step, action, ground_truth, match)
     
     def log_episode_end(self, episode_id: str, success: bool, accuracy: float):
-        self.logger.info(f"Episode {episode_id} completed: Success={success}, Accuracy={accuracy:.2f}")
+        self.logger.info("Episode %s completed: Success=%s, Accuracy=%.2f", episode_id, success, accuracy)
     
     def log_error(self, error_msg: str, context: str = ""):
-        self.logger.error(f"Error in {context}: {error_msg}")
+        self.logger.error("Error in %s: %s", context, error_msg)
+
+class CacheBackend(Protocol):
+    """Storage used by LLMCache, values are response strings stored under a hashed request key"""
+    
+    def get(self, key: str) -> Optional[str]:
+        ...
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ...
+
+class MemoryCacheBackend:
+    """In-process LRU store for cached LLM responses"""
+    
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+class SQLiteCacheBackend:
+    """On-disk store so cached LLM responses survive between benchmark runs"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    # the database is only opened on first use so creating the backend does not touch the disk
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+                )
+                # rows that expired since the last run are removed when the database is opened
+                self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        return self._conn
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                with conn:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            return value
+    
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+
+class _SemanticIndex:
+    """Normalized prompt embeddings of one namespace with the responses stored for them"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.count = 0
+        # once the index is full the oldest entry is overwritten, _next is the row written next
+        self._next = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._expires_at = np.empty(0, dtype=np.float64)
+        self._values: List[Optional[str]] = []
+    
+    # this function will make room for one more row, the matrix doubles in size until it reaches max_entries
+    def _grow(self, dim: int):
+        if self._matrix is None:
+            capacity = min(64, self.max_entries)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            self._expires_at = np.empty(capacity, dtype=np.float64)
+            self._values = [None] * capacity
+            return
+        capacity = min(len(self._matrix) * 2, self.max_entries)
+        matrix = np.empty((capacity, dim), dtype=np.float32)
+        matrix[:self.count] = self._matrix[:self.count]
+        expires_at = np.empty(capacity, dtype=np.float64)
+        expires_at[:self.count] = self._expires_at[:self.count]
+        self._matrix, self._expires_at = matrix, expires_at
+        self._values.extend([None] * (capacity - len(self._values)))
+    
+    def add(self, embedding: np.ndarray, value: str, expires_at: float):
+        if self._matrix is None or (self.count == len(self._matrix) and self.count < self.max_entries):
+            self._grow(len(embedding))
+        row = self._next
+        self._matrix[row] = embedding
+        self._expires_at[row] = expires_at
+        self._values[row] = value
+        self._next = (row + 1) % self.max_entries
+        self.count = min(self.count + 1, self.max_entries)
+    
+    def search(self, embedding: np.ndarray, threshold: float) -> Optional[str]:
+        if self.count == 0:
+            return None
+        similarities = self._matrix[:self.count] @ embedding
+        # expired entries stay in their rows until they are overwritten, they are only skipped here
+        similarities[self._expires_at[:self.count] < time.time()] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] >= threshold:
+            return self._values[best]
+        return None
+
+class LLMCache:
+    """Cache for LLM responses with exact lookups and an optional semantic fallback
+    
+    The semantic fallback needs an embedding function, the command line tools do not pass one so they only use exact lookups.
+    """
+    
+    def __init__(self, backends: Optional[List[CacheBackend]] = None, ttl: Optional[float] = 3600,
+                 embedder: Optional[Callable[[str], Sequence[float]]] = None, similarity_threshold: float = 0.92,
+                 max_semantic_entries: int = 10_000):
+        # the backends are checked in order, so the fastest one should come first
+        # by default responses are only kept in memory for this process, a disk backend has to be asked for
+        self.backends = backends if backends is not None else [MemoryCacheBackend()]
+        self.ttl = ttl
+        # the semantic lookup is only used when an embedding function is given
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self._semantic_entries: Dict[str, _SemanticIndex] = {}
+        self._semantic_lock = threading.Lock()
+    
+    @property
+    def blocking(self) -> bool:
+        """True when a lookup can wait on disk, so async callers should run it on a worker thread"""
+        return any(isinstance(backend, SQLiteCacheBackend) for backend in self.backends)
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """Hash everything that changes the response into a single key"""
+        payload = json.dumps({
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str, namespace: str = "", text: Optional[str] = None) -> Optional[str]:
+        for i, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                # a hit in a slower backend is copied into the faster ones in front of it
+                for faster in self.backends[:i]:
+                    faster.set(key, value, self.ttl)
+                return value
+        
+        if self.embedder is not None and text is not None:
+            return self._semantic_get(namespace, text)
+        return None
+    
+    def set(self, key: str, value: str, namespace: str = "", text: Optional[str] = None):
+        for backend in self.backends:
+            backend.set(key, value, self.ttl)
+        
+        if self.embedder is not None and text is not None:
+            embedding = self._embed(text)
+            expires_at = time.time() + self.ttl if self.ttl is not None else np.inf
+            with self._semantic_lock:
+                index = self._semantic_entries.get(namespace)
+                if index is None:
+                    index = self._semantic_entries[namespace] = _SemanticIndex(self.max_semantic_entries)
+                index.add(embedding, value, expires_at)
+    
+    def _embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.embedder(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+    
+    def _semantic_get(self, namespace: str, text: str) -> Optional[str]:
+        """Return the stored response whose prompt is most similar, if it is above the threshold"""
+        embedding = self._embed(text)
+        with self._semantic_lock:
+            index = self._semantic_entries.get(namespace)
+            if index is None:
+                return None
+            return index.search(embedding, self.similarity_threshold)
+
+# this function will build the cache used by the command line tools, responses are only written to disk when a cache directory is given
+def create_llm_cache(cache_dir: Optional[str] = None) -> LLMCache:
+    backends: List[CacheBackend] = [MemoryCacheBackend()]
+    if cache_dir:
+        backends.append(SQLiteCacheBackend(os.path.join(cache_dir, "llm_cache.sqlite")))
+    return LLMCache(backends)
+
+class ParsedAction(NamedTuple):
+    """Structured action parsed from an LLM response"""
+    action_type: str
+    target: Optional[str]
+    formatted: str
+    valid: bool
 
 class ActionParser:
     """Enhanced action parsing with validation"""
@@ -87,132 +367,212 @@ class ActionParser:
         'LONG_PRESS': r'LONG_PRESS\(["\']([^"\']*)["\']\)'
     }
     
+    # all patterns are compiled once into a single alternation, each one wrapped in a group named after its action type
+    ACTION_RE = re.compile(
+        '|'.join(f'(?P<{action_type}>{pattern})' for action_type, pattern in ACTION_PATTERNS.items()),
+        re.IGNORECASE
+    )
+    
     @classmethod
-    def parse_action(cls, response: str) -> Dict[str, Any]:
+    def parse_action(cls, response: str) -> ParsedAction:
         """Parse action from LLM response with validation"""
-        response = response.strip()
-        
-        for action_type, pattern in cls.ACTION_PATTERNS.items():
-            match = re.search(pattern, response, re.IGNORECASE)
-            if match:
-                return {
-                    'action_type': action_type,
-                    'target': match.group(1),
-                    'formatted': f'{action_type}("{match.group(1)}")',
-                    'valid': True
-                }
-        
-        # If no pattern matched, it's likely an error
-        return {
-            'action_type': 'UNKNOWN',
-            'target': None,
-            'formatted': response,
-            'valid': False
-        }
+        return _parse_action_cached(response.strip())
+    
+    @staticmethod
+    def element_sets(observation: Dict) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        """Exact and lowercased UI element sets of an observation, built once and stored on it"""
+        # the sets are built the first time an observation is validated and reused for every later validation
+        if '_ui_elements_set' not in observation:
+            elements = observation.get('ui_elements', [])
+            observation['_ui_elements_set'] = frozenset(elements)
+            observation['_ui_elements_lower'] = frozenset(element.lower() for element in elements)
+        return observation['_ui_elements_set'], observation['_ui_elements_lower']
     
     @classmethod
-    def validate_action(cls, action: Dict, available_elements: List[str]) -> bool:
+    def validate_action(cls, action: ParsedAction, observation: Dict) -> bool:
         """Validate if action target exists in available UI elements"""
-        if not action['valid']:
+        if not action.valid:
             return False
         
-        target = action['target']
+        target = action.target
         if not target:
             return False
         
-        # Exact match
-        if target in available_elements:
-            return True
-        
-        # Fuzzy match (case-insensitive)
-        for element in available_elements:
-            if target.lower() == element.lower():
-                return True
-        
-        return False
+        # Exact match, then fuzzy match (case-insensitive)
+        elements, elements_lower = cls.element_sets(observation)
+        return target in elements or target.lower() in elements_lower
+
+# identical responses come back often at low temperature, so parses are cached on the stripped response
+# ParsedAction is immutable, so the cached value can be handed out to every caller as is
+@lru_cache(maxsize=4096)
+def _parse_action_cached(response: str) -> ParsedAction:
+    match = ActionParser.ACTION_RE.search(response)
+    if match:
+        # the named group closes last so it is lastgroup, and the target is the group right after it
+        action_type = match.lastgroup
+        target = match.group(match.lastindex + 1)
+        return ParsedAction(action_type, target, f'{action_type}("{target}")', True)
+    
+    # If no pattern matched, it's likely an error
+    return ParsedAction('UNKNOWN', None, response, False)
 
 class ResultsAnalyzer:
     """Comprehensive analysis of evaluation results"""
     
     def __init__(self, results_file: str):
-        with open(results_file, 'r') as f:
-            self.data = json.load(f)
-        self.episode_results = self.data.get('episode_results', [])
-        self.aggregate_metrics = self.data.get('aggregate_metrics', {})
+        if results_file.endswith('.jsonl'):
+            self.episode_results, self.aggregate_metrics = self._load_jsonl(results_file)
+            self.data = {'aggregate_metrics': self.aggregate_metrics, 'episode_results': self.episode_results}
+        else:
+            with open(results_file, 'rb') as f:
+                self.data = orjson.loads(f.read())
+            self.episode_results = self.data.get('episode_results', [])
+            self.aggregate_metrics = self.data.get('aggregate_metrics', {})
+    
+    # this function will read a streamed results file one episode per line
+    # a finished run ends with an aggregate_metrics record, for a run that was cut short the metrics are summed up in the same pass
+    @staticmethod
+    def _load_jsonl(results_file: str) -> Tuple[List[Dict], Dict]:
+        episode_results = []
+        aggregate_metrics = None
+        successful_episodes = 0
+        accuracy_sum = 0.0
+        total_steps = 0
+        total_correct_steps = 0
+        with open(results_file, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = orjson.loads(line)
+                if 'aggregate_metrics' in result:
+                    aggregate_metrics = result['aggregate_metrics']
+                    continue
+                episode_results.append(result)
+                successful_episodes += result['episode_success']
+                accuracy_sum += result['step_accuracy']
+                total_steps += result['total_steps']
+                total_correct_steps += result['correct_steps']
+        
+        if aggregate_metrics is not None:
+            return episode_results, aggregate_metrics
+        if not episode_results:
+            return episode_results, {}
+        total_episodes = len(episode_results)
+        return episode_results, {
+            'total_episodes': total_episodes,
+            'episode_success_rate': successful_episodes / total_episodes,
+            'average_step_accuracy': accuracy_sum / total_episodes,
+            'total_steps': total_steps,
+            'total_correct_steps': total_correct_steps
+        }
     
     def generate_performance_plots(self, output_dir: str = "results"):
         """Generate visualization plots for performance analysis"""
+        plt = _pyplot()
         os.makedirs(output_dir, exist_ok=True)
         
-        # Convert to DataFrame for easier plotting
-        df = pd.DataFrame(self.episode_results)
+        # only three numeric columns are plotted, so they are pulled straight into arrays
+        n = len(self.episode_results)
+        success = np.fromiter((r['episode_success'] for r in self.episode_results), dtype=np.bool_, count=n)
+        accuracy = np.fromiter((r['step_accuracy'] for r in self.episode_results), dtype=np.float64, count=n)
+        steps = np.fromiter((r['total_steps'] for r in self.episode_results), dtype=np.int64, count=n)
+        
+        # one figure is reused for all four plots and cleared between them
+        fig, ax = plt.subplots(figsize=(10, 6))
+        fig.set_layout_engine('tight')
         
         # Plot 1: Episode Success Rate
-        plt.figure(figsize=(10, 6))
-        success_rate = df['episode_success'].mean()
-        plt.bar(['Success', 'Failure'], [success_rate, 1 - success_rate])
-        plt.title('Episode Success Rate')
-        plt.ylabel('Proportion')
-        plt.savefig(os.path.join(output_dir, 'episode_success_rate.png'))
-        plt.close()
+        success_rate = success.mean()
+        ax.bar(['Success', 'Failure'], [success_rate, 1 - success_rate])
+        ax.set_title('Episode Success Rate')
+        ax.set_ylabel('Proportion')
+        fig.savefig(os.path.join(output_dir, 'episode_success_rate.png'))
         
         # Plot 2: Step Accuracy Distribution
-        plt.figure(figsize=(10, 6))
-        plt.hist(df['step_accuracy'], bins=20, alpha=0.7, edgecolor='black')
-        plt.title('Distribution of Step Accuracy')
-        plt.xlabel('Step Accuracy')
-        plt.ylabel('Frequency')
-        plt.axvline(df['step_accuracy'].mean(), color='red', linestyle='--', label=f'Mean: {df["step_accuracy"].mean():.2f}')
-        plt.legend()
-        plt.savefig(os.path.join(output_dir, 'step_accuracy_distribution.png'))
-        plt.close()
+        ax.clear()
+        ax.hist(accuracy, bins=20, alpha=0.7, edgecolor='black')
+        ax.set_title('Distribution of Step Accuracy')
+        ax.set_xlabel('Step Accuracy')
+        ax.set_ylabel('Frequency')
+        mean_accuracy = accuracy.mean()
+        ax.axvline(mean_accuracy, color='red', linestyle='--', label=f'Mean: {mean_accuracy:.2f}')
+        ax.legend()
+        fig.savefig(os.path.join(output_dir, 'step_accuracy_distribution.png'))
         
         # Plot 3: Performance by Episode Length
-        df['episode_length'] = df['total_steps']
-        length_performance = df.groupby('episode_length')['episode_success'].mean()
+        # the success rate per length is the successes per length divided by the episodes per length
+        episodes_per_length = np.bincount(steps)
+        successes_per_length = np.bincount(steps, weights=success)
+        lengths = np.flatnonzero(episodes_per_length)
+        length_performance = successes_per_length[lengths] / episodes_per_length[lengths]
         
-        plt.figure(figsize=(12, 6))
-        length_performance.plot(kind='bar')
-        plt.title('Success Rate by Episode Length')
-        plt.xlabel('Episode Length (steps)')
-        plt.ylabel('Success Rate')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, 'performance_by_length.png'))
-        plt.close()
+        ax.clear()
+        fig.set_size_inches(12, 6)
+        ax.bar(lengths.astype(str), length_performance)
+        ax.set_title('Success Rate by Episode Length')
+        ax.set_xlabel('Episode Length (steps)')
+        ax.set_ylabel('Success Rate')
+        ax.tick_params(axis='x', rotation=45)
+        fig.savefig(os.path.join(output_dir, 'performance_by_length.png'))
         
         # Plot 4: Accuracy vs Success
-        plt.figure(figsize=(10, 6))
-        colors = ['red' if not success else 'green' for success in df['episode_success']]
-        plt.scatter(df['step_accuracy'], df['total_steps'], c=colors, alpha=0.6)
-        plt.xlabel('Step Accuracy')
-        plt.ylabel('Total Steps')
-        plt.title('Step Accuracy vs Episode Length (Red=Failed, Green=Success)')
-        plt.savefig(os.path.join(output_dir, 'accuracy_vs_length.png'))
-        plt.close()
+        # ax.clear() keeps the tick rotation, so it is reset by hand
+        ax.clear()
+        ax.tick_params(axis='x', rotation=0)
+        fig.set_size_inches(10, 6)
+        colors = np.where(success, 'green', 'red')
+        ax.scatter(accuracy, steps, c=colors, alpha=0.6)
+        ax.set_xlabel('Step Accuracy')
+        ax.set_ylabel('Total Steps')
+        ax.set_title('Step Accuracy vs Episode Length (Red=Failed, Green=Success)')
+        fig.savefig(os.path.join(output_dir, 'accuracy_vs_length.png'))
+        plt.close(fig)
+    
+    @staticmethod
+    def generate_comparative_plots(benchmark_results: List[Dict], output_dir: str = "results"):
+        """Plot every configuration of a comparative benchmark side by side in one figure"""
+        plt = _pyplot()
+        os.makedirs(output_dir, exist_ok=True)
+        
+        labels = [f"{r['model']}\n{r['prompt_template']}" for r in benchmark_results]
+        success_rates = [r['metrics'].get('episode_success_rate', 0) for r in benchmark_results]
+        step_accuracies = [r['metrics'].get('average_step_accuracy', 0) for r in benchmark_results]
+        
+        fig, (success_ax, accuracy_ax) = plt.subplots(1, 2, figsize=(14, 6))
+        success_ax.bar(labels, success_rates)
+        success_ax.set_title('Episode Success Rate by Configuration')
+        success_ax.set_ylabel('Success Rate')
+        accuracy_ax.bar(labels, step_accuracies)
+        accuracy_ax.set_title('Average Step Accuracy by Configuration')
+        accuracy_ax.set_ylabel('Step Accuracy')
+        for ax in (success_ax, accuracy_ax):
+            ax.tick_params(axis='x', rotation=45)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, 'comparative_performance.png'))
+        plt.close(fig)
     
     def generate_failure_analysis(self) -> Dict:
         """Analyze failure patterns in detail"""
-        failures = [r for r in self.episode_results if not r['episode_success']]
+        # the failed episodes and their failure steps are collected in one pass
+        total_failures = 0
+        failure_steps = []
+        for r in self.episode_results:
+            if not r['episode_success']:
+                total_failures += 1
+                failure_steps.extend(r['failure_points'])
         
         analysis = {
-            'total_failures': len(failures),
-            'failure_rate': len(failures) / len(self.episode_results) if self.episode_results else 0,
-            'avg_failure_step': sum(len(f['failure_points']) for f in failures) / len(failures) if failures else 0,
+            'total_failures': total_failures,
+            'failure_rate': total_failures / len(self.episode_results) if self.episode_results else 0,
+            'avg_failure_step': len(failure_steps) / total_failures if total_failures else 0,
             'failure_patterns': {}
         }
         
-        # Analyze where failures occur
-        failure_steps = []
-        for failure in failures:
-            failure_steps.extend(failure['failure_points'])
-        
+        # Analyze where failures occur, steps are bucketed as early (< 2), mid (2-4) and late (>= 5)
         if failure_steps:
-            analysis['failure_patterns'] = {
-                'early_failures': sum(1 for step in failure_steps if step < 2),
-                'mid_failures': sum(1 for step in failure_steps if 2 <= step < 5),
-                'late_failures': sum(1 for step in failure_steps if step >= 5)
-            }
+            steps = np.fromiter(failure_steps, dtype=np.int64, count=len(failure_steps))
+            buckets = np.bincount(np.digitize(steps, [2, 5]), minlength=3)
+            analysis['failure_patterns'] = dict(zip(['early_failures', 'mid_failures', 'late_failures'], buckets.tolist()))
         
         return analysis
     
@@ -242,12 +602,12 @@ class ResultsAnalyzer:
                     f.write(f"{pattern}: {count}\n")
             
             f.write("\nTOP PERFORMING EPISODES:\n")
-            top_episodes = sorted(self.episode_results, key=lambda x: x['step_accuracy'], reverse=True)[:5]
+            top_episodes = heapq.nlargest(5, self.episode_results, key=lambda x: x['step_accuracy'])
             for i, episode in enumerate(top_episodes, 1):
                 f.write(f"{i}. {episode['episode_id']}: {episode['step_accuracy']:.2%} accuracy\n")
             
             f.write("\nLOWEST PERFORMING EPISODES:\n")
-            bottom_episodes = sorted(self.episode_results, key=lambda x: x['step_accuracy'])[:5]
+            bottom_episodes = heapq.nsmallest(5, self.episode_results, key=lambda x: x['step_accuracy'])
             for i, episode in enumerate(bottom_episodes, 1):
                 f.write(f"{i}. {episode['episode_id']}: {episode['step_accuracy']:.2%} accuracy\n")
 
@@ -263,10 +623,22 @@ def main():
     parser.add_argument("--openai_key", help="OpenAI API key")
     parser.add_argument("--anthropic_key", help="Anthropic API key")
     
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes for the configurations (default: one per configuration, 1 runs them in this process)")
+    parser.add_argument("--wait_plots", action="store_true",
+                        help="Wait for the final report and plots before printing the summary")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the LLM response cache")
+    parser.add_argument("--cache_dir", nargs="?", const="", default=None,
+                        help="Also keep cached LLM responses on disk in this directory (defaults to --output_dir when given without a value)")
+    
     args = parser.parse_args()
     
+    # benchmark.py imports this module, so the runner is only imported when the benchmark is actually run
+    from benchmark import BenchmarkRunner
+    
     # Initialize benchmark runner
-    runner = BenchmarkRunner(args.data_path, args.output_dir)
+    cache_dir = args.output_dir if args.cache_dir == "" else args.cache_dir
+    runner = BenchmarkRunner(args.data_path, args.output_dir, use_cache=not args.no_cache, cache_dir=cache_dir)
     
     # Prepare configurations
     configs = []
@@ -284,14 +656,31 @@ def main():
                     'api_key': api_key
                 })
     
-    # Run benchmarks
-    results = runner.run_comparative_benchmark(configs, args.num_episodes)
+    # Run benchmarks, every configuration is independent so each one gets its own process
+    processes = args.processes if args.processes is not None else len(configs)
+    results = runner.run_comparative_benchmark(configs, args.num_episodes, processes=processes, plots=False)
+    
+    # Generate final report, the plots and report are written on a background thread so the summary is printed right away
+    # the thread is not a daemon, so the process still waits for it before exiting
+    # it is a single thread since pyplot keeps global state and is not safe to drive from several threads at once
+    def write_report():
+        ResultsAnalyzer.generate_comparative_plots(results['results'], args.output_dir)
+        runner.generate_final_report(results)
     
-    # Generate final report
-    runner.generate_final_report(results)
+    report_thread = threading.Thread(target=write_report, name="report-writer")
+    report_thread.start()
     
     print(f"\nBenchmark completed! Results saved to: {args.output_dir}")
-    print(f"View final report: {os.path.join(args.output_dir, 'final_report.md')}")
+    for result in results['results']:
+        metrics = result['metrics']
+        print(f"  {result['model']} / {result['prompt_template']}: "
+              f"success {metrics.get('episode_success_rate', 0):.2%}, step accuracy {metrics.get('average_step_accuracy', 0):.2%}")
+    
+    if args.wait_plots:
+        report_thread.join()
+        print(f"View final report: {os.path.join(args.output_dir, 'final_report.md')}")
+    else:
+        print(f"Final report is being written to: {os.path.join(args.output_dir, 'final_report.md')}")
 
 if __name__ == "__main__":
     main()